@@ -16,21 +16,25 @@ What it does NOT do:
 
 Usage:
   python apply_url_check_summary.py CT_Municipal_Employment_Pages.migrated.json url_check_summary.csv CT_Municipal_Employment_Pages.updated.json
+
+  Add --ndjson to read and write one JSON record per line instead of a single array.
 """
 
 from __future__ import annotations
 
 import csv
-import json
 import re
 import sys
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
-from urllib.parse import urlparse
+from urllib.parse import ParseResult, urlparse
+
+from dataset_io import cached_urlsplit, load_json, load_ndjson, write_json, write_ndjson
 
 
-CIVICPLUS_PAGEID_RE = re.compile(r"^/(\d{2,6})/[^/]+", re.IGNORECASE)
+CIVICPLUS_PAGEID_RE = re.compile(r"^/(\d{2,6})/[^/]+")
 
 # If true, update canonical URL on safe conditions:
 UPDATE_CANONICAL_ON_REDIRECT = True
@@ -39,6 +43,29 @@ UPDATE_CANONICAL_ON_CIVICPLUS_PAGEID = True
 # 403/401 are usually bot blocks; don't rewrite canonical based on them.
 DO_NOT_REWRITE_STATUSES = {401, 403}
 
+# Per-prefix metadata keys, spelled out once so the CSV loop doesn't format them per row:
+# (status_code, final, last_checked_at, soft404, error, change_reason, confidence)
+FIELD_KEYS: Dict[str, Tuple[str, str, str, str, str, str, str]] = {
+    "employment": (
+        "employment_url_status_code",
+        "employment_url_final",
+        "employment_url_last_checked_at",
+        "employment_url_soft404",
+        "employment_url_error",
+        "employment_url_change_reason",
+        "employment_url_confidence",
+    ),
+    "application": (
+        "application_url_status_code",
+        "application_url_final",
+        "application_url_last_checked_at",
+        "application_url_soft404",
+        "application_url_error",
+        "application_url_change_reason",
+        "application_url_confidence",
+    ),
+}
+
 
 def parse_iso_any(s: str) -> str:
     # keep whatever timestamp the CSV gave us; if missing, use now in local offset-less ISO.
@@ -47,25 +74,37 @@ def parse_iso_any(s: str) -> str:
     return datetime.now().isoformat()
 
 
+@lru_cache(maxsize=8192)
+def _cached_urlparse(u: str) -> Optional[ParseResult]:
+    # The CivicPlus check needs urlparse's path, which drops ";params" from the last segment.
+    try:
+        return urlparse(u)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
 def homepage(url: str) -> Optional[str]:
     if not isinstance(url, str) or not url.strip():
         return None
-    u = urlparse(url.strip())
-    if not u.scheme or not u.netloc:
+    u = cached_urlsplit(url.strip())
+    if u is None or not u.scheme or not u.netloc:
         return None
     return f"{u.scheme}://{u.netloc}/"
 
 
 def civicplus_pageid_path(u: str) -> Optional[str]:
     """Return '/<id>/<slug>' path if present, else None."""
-    try:
-        p = urlparse(u).path
-        m = CIVICPLUS_PAGEID_RE.match(p)
-        if not m:
-            return None
-        return p
-    except Exception:
+    parsed = _cached_urlparse(u)
+    if parsed is None:
+        return None
+    p = parsed.path
+    # Cheap shape check before the regex: most municipal paths don't start with a digit.
+    if not (len(p) > 2 and p[1].isdigit()):
         return None
+    if not CIVICPLUS_PAGEID_RE.match(p):
+        return None
+    return p
 
 
 def field_to_prefix(field: str) -> Optional[str]:
@@ -77,30 +116,51 @@ def field_to_prefix(field: str) -> Optional[str]:
 
 
 def main() -> int:
-    if len(sys.argv) != 4:
-        print("Usage: python apply_url_check_summary.py <input.json> <url_check_summary.csv> <output.json>")
+    args = sys.argv[1:]
+    ndjson = "--ndjson" in args
+    if ndjson:
+        args.remove("--ndjson")
+    if len(args) != 3:
+        print("Usage: python apply_url_check_summary.py [--ndjson] <input.json> <url_check_summary.csv> <output.json>")
         return 2
 
-    json_in = Path(sys.argv[1])
-    csv_in = Path(sys.argv[2])
-    json_out = Path(sys.argv[3])
+    json_in = Path(args[0])
+    csv_in = Path(args[1])
+    json_out = Path(args[2])
 
-    data = json.loads(json_in.read_text(encoding="utf-8"))
+    data = load_ndjson(json_in) if ndjson else load_json(json_in)
     if not isinstance(data, list):
         raise ValueError("Expected JSON to be a list (array) of objects.")
 
     # Index records by Town name (your dataset uses unique Town)
-    by_town: Dict[str, Dict[str, Any]] = {}
-    for rec in data:
-        if isinstance(rec, dict) and isinstance(rec.get("Town"), str):
-            by_town[rec["Town"]] = rec
+    by_town: Dict[str, Dict[str, Any]] = {
+        rec["Town"]: rec for rec in data if type(rec) is dict and type(rec.get("Town")) is str
+    }
 
     updates = 0
     with csv_in.open("r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
+        reader = csv.reader(f)
+        header = next(reader, [])
+        idx = {name: i for i, name in enumerate(header)}
+        # Rows are normalized to header width plus one trailing "" slot; missing columns
+        # point at that slot, so overflow fields can never be read as a missing column.
+        width = len(header)
+        i_town = idx.get("Town", width)
+        i_field = idx.get("Field", width)
+        i_status = idx.get("Status", width)
+        i_final = idx.get("Final URL", width)
+        i_soft = idx.get("Soft404", width)
+        i_err = idx.get("Error", width)
+        i_checked_utc = idx.get("checked_at_utc", width)
+        i_checked = idx.get("checked_at", width)
+
         for row in reader:
-            town = (row.get("Town") or "").strip()
-            field = (row.get("Field") or "").strip()
+            if len(row) != width:
+                del row[width:]
+                row.extend([""] * (width - len(row)))
+            row.append("")
+            town = row[i_town].strip()
+            field = row[i_field].strip()
             prefix = field_to_prefix(field)
             if not town or not prefix:
                 continue
@@ -109,22 +169,29 @@ def main() -> int:
                 continue
 
             # Stamp metadata
-            checked_at = parse_iso_any(row.get("checked_at_utc") or row.get("checked_at") or "")
-            status_str = (row.get("Status") or "").strip()
-            final_url = (row.get("Final URL") or "").strip() or None
-            soft404 = (row.get("Soft404") or "").strip().lower() == "true"
-            err = (row.get("Error") or "").strip() or None
-
-            try:
-                status = int(float(status_str)) if status_str else None
-            except Exception:
-                status = None
-
-            rec[f"{prefix}_url_status_code"] = status
-            rec[f"{prefix}_url_final"] = final_url
-            rec[f"{prefix}_url_last_checked_at"] = checked_at
-            rec[f"{prefix}_url_soft404"] = soft404
-            rec[f"{prefix}_url_error"] = err
+            checked_at = parse_iso_any(row[i_checked_utc] or row[i_checked])
+            status_str = row[i_status].strip()
+            final_url = row[i_final].strip() or None
+            soft404 = row[i_soft].strip().lower() == "true"
+            err = row[i_err].strip() or None
+
+            status: Optional[int] = None
+            if status_str:
+                try:
+                    status = int(status_str)
+                except ValueError:
+                    # Tolerate "200.0" style values from spreadsheet round-trips.
+                    try:
+                        status = int(float(status_str))
+                    except (ValueError, OverflowError):
+                        status = None
+
+            k_status, k_final, k_checked, k_soft, k_err, k_reason, k_conf = FIELD_KEYS[prefix]
+            rec[k_status] = status
+            rec[k_final] = final_url
+            rec[k_checked] = checked_at
+            rec[k_soft] = soft404
+            rec[k_err] = err
 
             # Ensure Town Website homepage
             if isinstance(rec.get("Town Website"), str):
@@ -135,32 +202,40 @@ def main() -> int:
                 if isinstance(cur, str):
                     rec["Town Website"] = homepage(cur) or rec.get("Town Website")
 
-            # Optionally rewrite canonical URLs on safe conditions
+            # Optionally rewrite canonical URLs on safe conditions. The gate depends only on
+            # the CSV row, so decide it once: never on bot-block statuses (401/403), never on
+            # a soft404 result alone, and only for successful (< 400) checks.
+            rewritable = (
+                final_url is not None
+                and status is not None
+                and status < 400
+                and status not in DO_NOT_REWRITE_STATUSES
+                and not soft404
+            )
             cur_url = rec.get(field)
-            if isinstance(cur_url, str) and final_url and status is not None:
-                if status in DO_NOT_REWRITE_STATUSES:
-                    pass  # don't touch canonical based on bot-block status
-                elif soft404:
-                    pass  # don't rewrite based only on a soft404 result
-                else:
-                    # 1) Redirect/Final URL rewrite
-                    if UPDATE_CANONICAL_ON_REDIRECT and status < 400 and final_url != cur_url:
-                        rec[field] = final_url
-                        rec[f"{prefix}_url_change_reason"] = "redirect_canonicalized"
-                        rec[f"{prefix}_url_confidence"] = 95
-                        updates += 1
-
-                    # 2) CivicPlus page-id canonicalization: prefer /<id>/<slug> over /home/pages/...
-                    if UPDATE_CANONICAL_ON_CIVICPLUS_PAGEID and status < 400 and final_url:
-                        cur_pid = civicplus_pageid_path(cur_url) is not None
-                        fin_pid = civicplus_pageid_path(final_url) is not None
-                        if fin_pid and not cur_pid:
-                            rec[field] = final_url
-                            rec[f"{prefix}_url_change_reason"] = "civicplus_pageid_canonicalized"
-                            rec[f"{prefix}_url_confidence"] = 95
-                            updates += 1
-
-    json_out.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+            if rewritable and isinstance(cur_url, str):
+                # 1) Redirect/Final URL rewrite
+                if UPDATE_CANONICAL_ON_REDIRECT and final_url != cur_url:
+                    rec[field] = final_url
+                    rec[k_reason] = "redirect_canonicalized"
+                    rec[k_conf] = 95
+                    updates += 1
+
+                # 2) CivicPlus page-id canonicalization: prefer /<id>/<slug> over /home/pages/...
+                if (
+                    UPDATE_CANONICAL_ON_CIVICPLUS_PAGEID
+                    and civicplus_pageid_path(final_url) is not None
+                    and civicplus_pageid_path(cur_url) is None
+                ):
+                    rec[field] = final_url
+                    rec[k_reason] = "civicplus_pageid_canonicalized"
+                    rec[k_conf] = 95
+                    updates += 1
+
+    if ndjson:
+        write_ndjson(json_out, data)
+    else:
+        write_json(json_out, data)
     print(f"Done. Wrote {json_out}. Canonical URL rewrites applied: {updates}")
     return 0
 
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+dataset_io.py
+
+Shared helpers for the dataset scripts (migrate_schema.py, apply_url_check_summary.py):
+- JSON array and NDJSON (one record per line) read/write.
+- Cached URL splitting for homepage derivation.
+
+orjson is used when installed; otherwise everything falls back to stdlib json.
+Output bytes are the same either way, with non-ASCII kept as-is:
+- arrays are 2-space indented;
+- NDJSON lines are compact (no spaces after "," or ":") and newline-terminated.
+"""
+
+from __future__ import annotations
+
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, List, Optional
+from urllib.parse import SplitResult, urlsplit
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+@lru_cache(maxsize=8192)
+def cached_urlsplit(u: str) -> Optional[SplitResult]:
+    """urlsplit(u), memoized; None if urlsplit rejects it (e.g. unbalanced IPv6 brackets)."""
+    try:
+        return urlsplit(u)
+    except ValueError:
+        return None
+
+
+def loads_json(b: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(b)
+    return json.loads(b)
+
+
+def load_json(path: Path) -> Any:
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def write_json(path: Path, data: Any) -> None:
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def load_ndjson(path: Path) -> List[Any]:
+    with path.open("rb") as f:
+        return [loads_json(line) for line in f if line.strip()]
+
+
+def ndjson_line(rec: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(rec, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def write_ndjson(path: Path, data: List[Any]) -> None:
+    with path.open("wb") as f:
+        f.writelines(ndjson_line(rec) for rec in data)
@@ -9,70 +9,96 @@ One-time migration to make the dataset self-healing:
 
 Usage:
   python migrate_schema.py CT_Municipal_Employment_Pages.json CT_Municipal_Employment_Pages.migrated.json
+
+  Add --ndjson to stream one JSON record per line (input and output paths must differ).
 """
 
 from __future__ import annotations
 
-import json
 import sys
 from pathlib import Path
 from typing import Any, Dict, List, Optional
-from urllib.parse import urlparse
+
+from dataset_io import cached_urlsplit, loads_json, load_json, ndjson_line, write_json
 
 
 def homepage_from_url(url: str) -> Optional[str]:
+    """Return 'scheme://host/' for url, or None if it is empty, relative or malformed."""
     if not isinstance(url, str) or not url.strip():
         return None
-    try:
-        u = urlparse(url.strip())
-        if not u.scheme or not u.netloc:
-            return None
-        return f"{u.scheme}://{u.netloc}/"
-    except Exception:
+    u = cached_urlsplit(url.strip())
+    if u is None or not u.scheme or not u.netloc:
         return None
+    return f"{u.scheme}://{u.netloc}/"
 
 
-def main() -> int:
-    if len(sys.argv) != 3:
-        print("Usage: python migrate_schema.py <input.json> <output.json>")
-        return 2
+def migrate_record(rec: Any) -> int:
+    """Migrate one record in place; return the number of fields changed."""
+    if not isinstance(rec, dict):
+        return 0
 
-    in_path = Path(sys.argv[1])
-    out_path = Path(sys.argv[2])
+    changed = 0
 
-    data = json.loads(in_path.read_text(encoding="utf-8"))
-    if not isinstance(data, list):
-        raise ValueError("Expected input JSON to be a list (array) of objects.")
+    # Read each URL field once; everything below works off these locals.
+    town_site = rec.get("Town Website")
+    emp = rec.get("Employment Page URL")
+    app = rec.get("Application Form URL")
 
-    changed = 0
-    for rec in data:
-        if not isinstance(rec, dict):
-            continue
+    # Ensure Town Website is homepage. If it is missing or not a clean homepage,
+    # derive from employment URL first, then application URL.
+    home = homepage_from_url(town_site) or homepage_from_url(emp) or homepage_from_url(app)
+    if home and town_site != home:
+        rec["Town Website"] = home
+        changed += 1
 
-        # Ensure Town Website is homepage.
-        town_site = rec.get("Town Website")
-        home = homepage_from_url(town_site) if isinstance(town_site, str) else None
+    # Freeze originals (immutable)
+    if isinstance(emp, str) and "Employment Page URL (original)" not in rec:
+        rec["Employment Page URL (original)"] = emp
+        changed += 1
 
-        # If Town Website is missing or not a clean homepage, derive from employment URL first, then application URL.
-        if not home:
-            emp = rec.get("Employment Page URL")
-            app = rec.get("Application Form URL")
-            home = homepage_from_url(emp) or homepage_from_url(app)
+    if isinstance(app, str) and "Application Form URL (original)" not in rec:
+        rec["Application Form URL (original)"] = app
+        changed += 1
 
-        if home and rec.get("Town Website") != home:
-            rec["Town Website"] = home
-            changed += 1
+    return changed
 
-        # Freeze originals (immutable)
-        if "Employment Page URL (original)" not in rec and isinstance(rec.get("Employment Page URL"), str):
-            rec["Employment Page URL (original)"] = rec["Employment Page URL"]
-            changed += 1
 
-        if "Application Form URL (original)" not in rec and isinstance(rec.get("Application Form URL"), str):
-            rec["Application Form URL (original)"] = rec["Application Form URL"]
-            changed += 1
+def main() -> int:
+    args = sys.argv[1:]
+    ndjson = "--ndjson" in args
+    if ndjson:
+        args.remove("--ndjson")
+    if len(args) != 2:
+        print("Usage: python migrate_schema.py [--ndjson] <input.json> <output.json>")
+        return 2
+
+    in_path = Path(args[0])
+    out_path = Path(args[1])
+
+    changed = 0
+    if ndjson:
+        # Single streaming pass: one record in memory at a time.
+        if in_path.resolve() == out_path.resolve():
+            print("--ndjson streams input to output; use a different output path.")
+            return 2
+        with in_path.open("rb") as fin, out_path.open("wb") as fout:
+            for line in fin:
+                if not line.strip():
+                    continue
+                rec = loads_json(line)
+                changed += migrate_record(rec)
+                fout.write(ndjson_line(rec))
+        print(f"Done. Wrote {out_path}. Records updated: {changed}")
+        return 0
+
+    data = load_json(in_path)
+    if not isinstance(data, list):
+        raise ValueError("Expected input JSON to be a list (array) of objects.")
+
+    for rec in data:
+        changed += migrate_record(rec)
 
-    out_path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    write_json(out_path, data)
     print(f"Done. Wrote {out_path}. Records updated: {changed}")
     return 0
 